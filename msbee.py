@@ -1,183 +1,249 @@
+import json
 import os
 import re
+import sys
+import time
 from datetime import date
 from pathlib import Path
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
 from dotenv import load_dotenv
 from openai import OpenAI
 from task import Task
-from task_ids import add_task_ids_to_vault
+from task_ids import add_task_ids_to_vault, walk_md
 
 # === LOAD ENVIRONMENT VARIABLES ===
 load_dotenv()
 
+# === PATTERNS ===
+_META_SPLIT_RE = re.compile(r" (?:➕|📅|⏭️|⛔|🆔|✅) ")
+_TASK_RE = re.compile(r"\s*- \[([ x])\]\s*(.*)")
+# Start date and ID tokens, found together in one scan of the task text
+_META_TOKEN_RE = re.compile(r'🛫 (\d{4}-\d{2}-\d{2})|🆔 ([a-zA-Z0-9]{6})')
+_DEP_RE = re.compile(r'⏭️ (.*?)(?=\s*$|\s*[#@])')
+_START_MARKER = "<!-- START tasks -->"
+_END_MARKER = "<!-- END tasks -->"
+_TASKS_SECTION_RE = re.compile(f"{re.escape(_START_MARKER)}.*?{re.escape(_END_MARKER)}", re.DOTALL)
+
+# Parsed task rows per markdown file, stored at the vault root
+TASK_INDEX_FILE = ".msbee_cache.json"
+_TASK_INDEX_VERSION = 3
+
+# OpenAI clients by API key, shared so their HTTP connection pools outlive any one MsBee
+_clients = {}
+
+# Roadmap contents by path, with the (mtime_ns, size) they were read at
+_roadmap_cache = {}
+
+def _get_client(api_key):
+    """Return the process-wide OpenAI client for this API key, creating it on first use."""
+    if api_key not in _clients:
+        _clients[api_key] = OpenAI(api_key=api_key)
+    return _clients[api_key]
+
 class MsBee:
-    def __init__(self, vault_path=None, daily_notes_path=None, roadmap_path=None, openai_api_key=None):
+    def __init__(self, vault_path=None, daily_notes_path=None, roadmap_path=None, openai_api_key=None, model=None):
         self.vault_path = Path(vault_path or os.environ.get("MSBEE_VAULT_PATH", "."))
         self.daily_notes_path = Path(daily_notes_path) if daily_notes_path else self.vault_path / os.environ.get("MSBEE_DAILY_PATH", "daily")
         self.roadmap_path = Path(roadmap_path) if roadmap_path else self.vault_path / os.environ.get("MSBEE_ROADMAP_PATH", "msbee/roadmap.md")
         self.openai_api_key = openai_api_key or os.environ.get("OPENAI_API_KEY")
         if not self.openai_api_key:
             raise ValueError("Missing OPENAI_API_KEY environment variable.")
-        self.client = OpenAI(api_key=self.openai_api_key)
+        self.client = _get_client(self.openai_api_key)
+        self.model = model or os.environ.get("MSBEE_MODEL", "gpt-4o-mini")
 
     @staticmethod
+    @lru_cache(maxsize=4096)
     def clean_task_text(task_text):
         """Clean a task text by removing all metadata (emojis, dates, etc)."""
-        clean_text = task_text.split(" ➕ ")[0] if " ➕ " in task_text else task_text
-        clean_text = clean_text.split(" 📅 ")[0] if " 📅 " in clean_text else clean_text
-        clean_text = clean_text.split(" ⏭️ ")[0] if " ⏭️ " in clean_text else clean_text
-        clean_text = clean_text.split(" ⛔ ")[0] if " ⛔ " in clean_text else clean_text
-        clean_text = clean_text.split(" 🆔 ")[0] if " 🆔 " in clean_text else clean_text
-        return clean_text
+        match = _META_SPLIT_RE.search(task_text)
+        return task_text[:match.start()] if match else task_text
+
+    def _parse_md(self, path):
+        """Extract raw task rows from a single markdown file.
+
+        Each row is (is_completed, clean_text, task_text, start_date, dependency,
+        task_id), with the start date kept as an ISO string. Completed tasks only
+        carry their clean text.
+        """
+        with open(path, "rb") as f:
+            data = f.read()
+        # Most notes have no tasks at all; skip them before decoding
+        if data.find(b"- [") < 0:
+            return []
+
+        rows = []
+        for line in data.decode("utf-8").splitlines():
+            # Match the raw line; only task lines pay for stripping
+            match = _TASK_RE.match(line)
+            if not match:
+                continue
+            status = match.group(1)
+            task_text = match.group(2).rstrip()
+
+            # Track completed tasks
+            if status == "x":
+                rows.append((True, self.clean_task_text(task_text), None, None, None, None))
+                continue
+
+            # Process uncompleted tasks
+            clean_text = self.clean_task_text(task_text)
+
+            # Check for start date and task ID, keeping the first of each
+            start_date = None
+            task_id = None
+            for token in _META_TOKEN_RE.finditer(task_text):
+                if token.group(1) and start_date is None:
+                    start_date = token.group(1)
+                elif token.group(2) and task_id is None:
+                    task_id = token.group(2)
+                if start_date and task_id:
+                    break
+
+            # Check for dependencies (⏭️)
+            dependency = None
+            dependency_match = _DEP_RE.search(task_text)
+            if dependency_match:
+                dependency_text = dependency_match.group(1).strip()
+                dependency = self.clean_task_text(dependency_text)
+
+            rows.append((False, clean_text, task_text, start_date, dependency, task_id))
+        return rows
+
+    def _load_task_index(self):
+        """Load the parsed-task index as {path: [[mtime_ns, size], rows]}."""
+        try:
+            with open(self.vault_path / TASK_INDEX_FILE, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(index, dict) or index.get("version") != _TASK_INDEX_VERSION:
+            return {}
+        return index.get("files", {})
+
+    def _save_task_index(self, files):
+        try:
+            with open(self.vault_path / TASK_INDEX_FILE, "w", encoding="utf-8") as f:
+                json.dump({"version": _TASK_INDEX_VERSION, "files": files}, f, ensure_ascii=False)
+        except OSError:
+            pass  # The index is only a cache; the next run will rebuild it
 
     def extract_tasks(self, today=date.today()):
         task_objects = {}  # Map of clean task text to Task object
         completed_tasks = set()
- 
-        # First pass: collect all tasks and create Task objects
-        for md in self.vault_path.rglob("*.md"):
-            if "Templates" in str(md):
+
+        # First pass: reuse indexed rows for unchanged files and parse the rest concurrently
+        index = self._load_task_index()
+        files = {}
+        stale = []
+        for entry in walk_md(self.vault_path):
+            if "Templates" in entry.path:
                 continue
-            with open(md, "r", encoding="utf-8") as f:
-                lines = f.readlines()
-            for line in lines:
-                line = line.strip()
-                if not line:
-                    continue
-                
-                # Track completed tasks
-                if line.startswith("- [x]"):
-                    task_text = line[6:].strip()  # Remove "- [x] "
-                    completed_tasks.add(self.clean_task_text(task_text))
+            st = entry.stat()
+            key = [st.st_mtime_ns, st.st_size]
+            cached = index.get(entry.path)
+            if cached and cached[0] == key:
+                files[entry.path] = cached
+            else:
+                files[entry.path] = [key, None]
+                stale.append(entry.path)
+        if stale:
+            with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4)) as executor:
+                for path, rows in zip(stale, executor.map(self._parse_md, stale)):
+                    files[path][1] = rows
+        # Save when files were re-parsed or have disappeared since the last run
+        if stale or len(files) != len(index):
+            self._save_task_index(files)
+
+        # Create Task objects in walk order
+        relative_paths = {}  # Map of file Path to its vault-relative path string
+        for path, (_, rows) in files.items():
+            md = None  # Only build a Path for files that contain open tasks
+            for is_completed, clean_text, task_text, start_date, dependency, task_id in rows:
+                # Intern the keys shared by task_objects, completed_tasks and dependencies
+                clean_text = sys.intern(clean_text)
+                if is_completed:
+                    completed_tasks.add(clean_text)
                     continue
-                
-                # Process uncompleted tasks
-                if line.startswith("- [ ]"):
-                    task_text = line[6:].strip()  # Remove "- [ ] "
-                    clean_text = self.clean_task_text(task_text)
-                    
-                    # Check for start date
-                    start_date = None
-                    start_date_match = re.search(r'🛫 (\d{4}-\d{2}-\d{2})', task_text)
-                    if start_date_match:
-                        start_date = date.fromisoformat(start_date_match.group(1))
-                    
-                    # Check for dependencies (⏭️)
-                    dependencies = set()
-                    dependency_match = re.search(r'⏭️ (.*?)(?=\s*$|\s*[#@])', task_text)
-                    if dependency_match:
-                        dependency_text = dependency_match.group(1).strip()
-                        dependencies.add(self.clean_task_text(dependency_text))
-                    
-                    # Extract task ID
-                    task_id = None
-                    id_match = re.search(r'🆔 ([a-zA-Z0-9]{6})', task_text)
-                    if id_match:
-                        task_id = id_match.group(1)
-                    
-                    # Create Task object
-                    task = Task(
-                        text=task_text,
-                        location=md,
-                        start_date=start_date,
-                        dependencies=dependencies
-                    )
-                    task_objects[clean_text] = task
-        
-        # Second pass: resolve dependencies to actual Task objects
-        for task in task_objects.values():
-            resolved_dependencies = set()
-            for dep_text in task.dependencies:
-                if dep_text in task_objects:
-                    resolved_dependencies.add(task_objects[dep_text])
-            task.dependencies = resolved_dependencies
-        
-        # Third pass: mark completed tasks
-        for clean_text in completed_tasks:
-            if clean_text in task_objects:
-                task_objects[clean_text].is_completed = True
-        
-        # Fourth pass: return only eligible tasks with their IDs
+                if md is None:
+                    md = Path(path)
+                    relative_paths[md] = str(md.relative_to(self.vault_path))
+                task = Task(
+                    text=task_text,
+                    location=md,
+                    start_date=date.fromisoformat(start_date) if start_date else None,
+                    dependencies={sys.intern(dependency)} if dependency else set(),
+                    task_id=task_id
+                )
+                task_objects[clean_text] = task
+
+        completed_tasks = frozenset(completed_tasks)
+
+        # Second pass: resolve dependencies, mark completion and keep eligible tasks with their IDs
         eligible_tasks = []
-        for task in task_objects.values():
+        for clean_text, task in task_objects.items():
+            task.dependencies = {task_objects[dep_text] for dep_text in task.dependencies if dep_text in task_objects}
+            task.is_completed = clean_text in completed_tasks
             if task.is_eligible(today):
-                # Extract task ID from the task text
-                task_id = None
-                id_match = re.search(r'🆔 ([a-zA-Z0-9]{6})', task.text)
-                if id_match:
-                    task_id = id_match.group(1)
-                eligible_tasks.append((task.text, task.location, task_id))
+                eligible_tasks.append((task.text, task.location, task.task_id, relative_paths[task.location]))
         
         return eligible_tasks
 
     def extract_roadmap(self):
-        if not self.roadmap_path.exists():
+        try:
+            st = self.roadmap_path.stat()
+        except FileNotFoundError:
             return "No roadmap found."
+        key = (st.st_mtime_ns, st.st_size)
+        cached = _roadmap_cache.get(self.roadmap_path)
+        if cached and cached[0] == key:
+            return cached[1]
         with open(self.roadmap_path, "r", encoding="utf-8") as f:
-            return f.read()
+            roadmap = f.read()
+        _roadmap_cache[self.roadmap_path] = (key, roadmap)
+        return roadmap
 
-    def ask_msbee(self, tasks, roadmap):
-        # Format tasks with their locations and IDs for the prompt
+    def _describe_tasks(self, tasks):
+        """Number the tasks for a prompt, with their relative paths and IDs."""
         task_descriptions = []
-        task_id_map = {}  # Map of (desc, path) to task_id
-        
-        for i, (task_text, location, task_id) in enumerate(tasks, 1):
-            relative_path = location.relative_to(self.vault_path)
-            clean_desc = self.clean_task_text(task_text)
+        for i, (task_text, location, task_id, relative_path) in enumerate(tasks, 1):
             task_descriptions.append(f'{i}. "{task_text}" in {relative_path} (ID: {task_id})')
-            task_id_map[(clean_desc, str(relative_path))] = task_id
+        return "\n".join(task_descriptions)
 
-        # Prompt the LLM to select 3 tasks and explain why, returning the ID for each
-        prompt = f"""
-You are MsBee, a gentle but clever assistant.
+    def _task_id_map(self, tasks):
+        """Map each task ID to the (description, relative path) shown in the note."""
+        return {
+            task_id: (self.clean_task_text(task_text), relative_path)
+            for task_text, location, task_id, relative_path in tasks
+            if task_id
+        }
 
-Here are your open tasks:
-{chr(10).join(task_descriptions)}
+    def _format_reply(self, plan, tasks):
+        """Build the daily note section from MsBee's JSON plan for the given tasks."""
+        # JSON mode only guarantees valid JSON, so anything off-shape is skipped
+        if not isinstance(plan, dict):
+            plan = {}
+        focus = plan.get("focus")
+        if not isinstance(focus, list):
+            focus = []
 
-And here's the user's high-level roadmap:
-{roadmap}
-
-Pick the three most important tasks for today, based on the roadmap and context. For each, copy the description, the full relative file path, and the ID exactly as shown above (not just the folder), and explain in 1-2 sentences why you picked it. Respond in Markdown like this:
-
-## 🌟 Focus Tasks
-1. "Task description" in path/to/file.md (ID: abc123) — reason
-2. "Task description" in path/to/file.md (ID: def456) — reason
-3. "Task description" in path/to/file.md (ID: ghi789) — reason
-
-## 🐝 Nudge
-Your motivational message here
-
-## 🔒 Lock Screen Quote
-"Your one-liner here"
-"""
-        response = self.client.chat.completions.create(
-            model="gpt-4",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
-        )
-        gpt_content = response.choices[0].message.content
-
-        # Parse the LLM's response to extract the 3 chosen tasks (with ID)
+        # Look the picks up by ID, dropping any the model made up
+        task_id_map = self._task_id_map(tasks)
         chosen_tasks = []
         reasons = []
-        focus_section = re.search(r"## 🌟 Focus Tasks(.+?)(## |$)", gpt_content, re.DOTALL)
-        if focus_section:
-            lines = focus_section.group(1).strip().splitlines()
-            for line in lines:
-                m = re.match(r'\d+\.\s*"(.+?)" in ([^\s]+) \(ID: ([a-zA-Z0-9]{6})\)\s*[—-]\s*(.+)', line)
-                if m:
-                    desc, path, task_id, reason = m.groups()
-                    chosen_tasks.append((desc, path, task_id))
-                    reasons.append(reason)
-                else:
-                    # fallback: try to match without reason
-                    m = re.match(r'\d+\.\s*"(.+?)" in ([^\s]+) \(ID: ([a-zA-Z0-9]{6})\)', line)
-                    if m:
-                        desc, path, task_id = m.groups()
-                        chosen_tasks.append((desc, path, task_id))
-                        reasons.append("")
+        for pick in focus:
+            if isinstance(pick, str):
+                task_id, reason = pick, ""  # A bare ID without a reason
+            elif isinstance(pick, dict):
+                task_id, reason = pick.get("id"), pick.get("reason")
+            else:
+                continue
+            if isinstance(task_id, str) and task_id in task_id_map:
+                desc, path = task_id_map[task_id]
+                chosen_tasks.append((desc, path, task_id))
+                reasons.append(reason if isinstance(reason, str) else "")
 
         # Generate the tasks query using task IDs
         task_conditions = []
@@ -205,15 +271,152 @@ Your motivational message here
                 focus_md += f' — {reasons[i-1]}'
             focus_md += '\n'
 
-        # Reconstruct the rest of the LLM's response (nudge, quote)
-        nudge_section = re.search(r'## 🐝 Nudge(.+?)(## |$)', gpt_content, re.DOTALL)
-        nudge_md = nudge_section.group(0).strip() if nudge_section else ''
-        quote_section = re.search(r'## 🔒 Lock Screen Quote(.+)', gpt_content, re.DOTALL)
-        quote_md = quote_section.group(0).strip() if quote_section else ''
-
+        nudge = plan.get("nudge")
+        if not isinstance(nudge, str):
+            nudge = ""
+        quote = plan.get("quote")
+        quote = f'"{quote if isinstance(quote, str) else ""}"'
         return f"""## 🌟 Focus Tasks
 {focus_md}
-{nudge_md}\n\n{quote_md}"""
+## 🐝 Nudge
+{nudge}
+
+## 🔒 Lock Screen Quote
+{quote}"""
+
+    def _chat_request(self, prompt):
+        """Keyword arguments for a chat completion request with the given prompt."""
+        return {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": 0.7,
+            "response_format": {"type": "json_object"},
+        }
+
+    def _complete(self, prompt):
+        """Stream a chat completion for the prompt and return the full reply text."""
+        stream = self.client.chat.completions.create(**self._chat_request(prompt), stream=True)
+        parts = []
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+        return "".join(parts)
+
+    def _build_prompt(self, tasks, roadmap):
+        # Prompt the LLM to select 3 tasks and explain why, returning the ID for each
+        return f"""
+You are MsBee, a gentle but clever assistant.
+
+Here are your open tasks:
+{self._describe_tasks(tasks)}
+
+And here's the user's high-level roadmap:
+{roadmap}
+
+Pick the three most important tasks for today, based on the roadmap and context. For each, give only its ID exactly as shown above and explain in 1-2 sentences why you picked it. Also write a motivational nudge and a one-line lock screen quote. Respond with JSON like this:
+
+{{"focus": [{{"id": "abc123", "reason": "reason"}}, {{"id": "def456", "reason": "reason"}}, {{"id": "ghi789", "reason": "reason"}}], "nudge": "Your motivational message here", "quote": "Your one-liner here"}}
+"""
+
+    def _load_plan(self, gpt_content):
+        """Decode a JSON reply, giving {} for a truncated or non-object one."""
+        try:
+            plan = json.loads(gpt_content)
+        except ValueError:
+            return {}
+        return plan if isinstance(plan, dict) else {}
+
+    def _parse_reply(self, gpt_content, tasks):
+        return self._format_reply(self._load_plan(gpt_content), tasks)
+
+    def ask_msbee(self, tasks, roadmap):
+        return self._parse_reply(self._complete(self._build_prompt(tasks, roadmap)), tasks)
+
+    def ask_msbee_many(self, inputs):
+        """Plan several days in one LLM call.
+
+        `inputs` is a list of (tasks, roadmap) pairs, one per day or user. Returns
+        one daily note section per input, in the same order.
+        """
+        days = []
+        for i, (tasks, roadmap) in enumerate(inputs, 1):
+            days.append(f"""### Day {i}
+Open tasks:
+{self._describe_tasks(tasks)}
+
+Roadmap:
+{roadmap}
+""")
+
+        prompt = f"""
+You are MsBee, a gentle but clever assistant.
+
+You are planning {len(inputs)} separate days. Treat each day on its own and only pick tasks listed for that day.
+
+{chr(10).join(days)}
+For each day, pick the three most important tasks based on that day's roadmap and context. For each, give only its ID exactly as shown above and explain in 1-2 sentences why you picked it. Also write a motivational nudge and a one-line lock screen quote. Respond with JSON holding one plan per day, in order, like this:
+
+{{"days": [{{"focus": [{{"id": "abc123", "reason": "reason"}}], "nudge": "Your motivational message here", "quote": "Your one-liner here"}}]}}
+"""
+        plans = self._load_plan(self._complete(prompt)).get("days")
+        if not isinstance(plans, list):
+            plans = []
+        if len(plans) != len(inputs):
+            raise ValueError(f"Expected {len(inputs)} days from MsBee, got {len(plans)}.")
+        return [self._format_reply(plan, tasks) for (tasks, roadmap), plan in zip(inputs, plans)]
+
+    def ask_msbee_batch(self, inputs, poll_interval=60):
+        """Plan several days through the OpenAI Batch API.
+
+        Batch requests cost less and use a separate rate limit, but finish
+        asynchronously (within 24h), so this suits scheduled or backfill runs;
+        keep ask_msbee for interactive use. `inputs` is a list of (tasks, roadmap)
+        pairs and one daily note section is returned per input, in order.
+        """
+        lines = []
+        for i, (tasks, roadmap) in enumerate(inputs):
+            lines.append(json.dumps({
+                "custom_id": str(i),
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": self._chat_request(self._build_prompt(tasks, roadmap)),
+            }))
+        batch_input = self.client.files.create(
+            file=("msbee_batch.jsonl", "\n".join(lines).encode("utf-8")),
+            purpose="batch",
+        )
+        batch = self.client.batches.create(
+            input_file_id=batch_input.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+        )
+
+        # Poll until the batch reaches a terminal state
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            time.sleep(poll_interval)
+            batch = self.client.batches.retrieve(batch.id)
+        if batch.status != "completed":
+            raise RuntimeError(f"MsBee batch {batch.id} ended with status {batch.status}.")
+        # A batch whose requests all failed still completes, with only an error file
+        if not batch.output_file_id:
+            raise RuntimeError(f"MsBee batch {batch.id} has no output; see error file {batch.error_file_id}.")
+
+        contents = {}
+        for line in self.client.files.content(batch.output_file_id).text.splitlines():
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            response = result.get("response")
+            # Failed requests are reported below as inputs with no reply
+            if response and response.get("status_code") == 200:
+                contents[result["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+
+        replies = []
+        for i, (tasks, roadmap) in enumerate(inputs):
+            if str(i) not in contents:
+                raise RuntimeError(f"MsBee batch {batch.id} has no reply for input {i}.")
+            replies.append(self._parse_reply(contents[str(i)], tasks))
+        return replies
 
     def update_daily_note(self, content, note_date=date.today()):
         daily_note = self.daily_notes_path / f"{note_date.isoformat()}.md"
@@ -224,18 +427,12 @@ Your motivational message here
         with open(daily_note, "r", encoding="utf-8") as f:
             text = f.read()
 
-        # Look for the task markers
-        start_marker = "<!-- START tasks -->"
-        end_marker = "<!-- END tasks -->"
-        
-        if start_marker in text and end_marker in text:
-            # Replace content between markers
-            pattern = f"{start_marker}.*?{end_marker}"
-            replacement = f"{start_marker}\n{content}\n{end_marker}"
-            updated_text = re.sub(pattern, replacement, text, flags=re.DOTALL)
-        else:
+        # Replace content between the task markers; a callable keeps backslashes in content literal
+        section = f"{_START_MARKER}\n{content}\n{_END_MARKER}"
+        updated_text, replaced = _TASKS_SECTION_RE.subn(lambda _: section, text, count=1)
+        if not replaced:
             # If markers don't exist, append the content with markers
-            updated_text = text.strip() + f"\n\n{start_marker}\n{content}\n{end_marker}"
+            updated_text = text.strip() + f"\n\n{section}"
 
         with open(daily_note, "w", encoding="utf-8") as f:
             f.write(updated_text)
@@ -1,9 +1,12 @@
 class Task:
-    def __init__(self, text, location, start_date=None, dependencies=None):
+    __slots__ = ("text", "location", "start_date", "dependencies", "task_id", "is_completed")
+
+    def __init__(self, text, location, start_date=None, dependencies=None, task_id=None):
         self.text = text
         self.location = location
         self.start_date = start_date
         self.dependencies = dependencies or set()
+        self.task_id = task_id
         self.is_completed = False
 
     def is_eligible(self, today):
@@ -1,56 +1,219 @@
-import re
+import json
+import mmap
+import os
 import random
+import re
 import string
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
-def generate_short_id():
+# Space-prefixed metadata markers. " ⏭" matches ⏭️ with or without its U+FE0F
+# variation selector, and never lands between the two code points.
+_METADATA_MARKERS = (" ➕", " 📅", " ⏭", " ⛔", " 🆔")
+_HAS_ID = "🆔 "
+_OPEN_TASK = "- [ ]"
+# Byte forms of the markers, used to rule out whole files before decoding them
+_OPEN_TASK_BYTES = _OPEN_TASK.encode("utf-8")
+_ID_BYTES = "🆔".encode("utf-8")
+_HAS_ID_BYTES = _HAS_ID.encode("utf-8")
+# Every open task line of a whole note, found in one pass over the raw bytes
+_OPEN_TASK_LINE_RE = re.compile(rb"^- \[ \][^\n]*", re.M)
+_PROCESS_POOL_MIN_FILES = 64
+# Below this size reading a note outright is cheaper than mapping it (and mmap
+# can't map an empty file at all). Larger notes are mapped read-only just to
+# check whether any task needs an ID. If the note is truncated while mapped
+# (Obsidian saves in place), touching pages past the new end raises SIGBUS and
+# kills the process rather than raising. The map is never used to build a
+# rewrite, which keeps that window to the scan itself.
+_MMAP_MIN_SIZE = 1 << 16
+# Stat of every note as of the last run, stored at the vault root
+ID_MANIFEST_FILE = ".msbee_ids.json"
+# Use base62 characters (0-9, a-z, A-Z) for 6-character IDs
+_ALPHABET = (string.ascii_letters + string.digits).encode("ascii")
+# Maps every byte value onto the alphabet, so a whole draw converts in one translate()
+_BASE62_TABLE = bytes(_ALPHABET[b % 62] for b in range(256))
+# Bytes 248 and up are dropped by that same translate(): 248 is 4 * 62, so the
+# bytes kept cover every character equally often
+_REJECTED_BYTES = bytes(range(4 * 62, 256))
+
+def _find_metadata(line: str) -> int:
+    """Return the index of the space before the first metadata emoji, or -1."""
+    best = -1
+    for marker in _METADATA_MARKERS:
+        pos = line.find(marker)
+        if pos != -1 and (best == -1 or pos < best):
+            best = pos
+    return best
+
+def _generate_short_ids(count: int) -> list[str]:
+    """Generate `count` short IDs, normally from a single random draw."""
+    needed = count * 6
+    chars = b""
+    while len(chars) < needed:
+        # Over-draw a little so the rejected bytes rarely force a second round
+        short = needed - len(chars)
+        chars += random.randbytes(short + short // 16 + 8).translate(_BASE62_TABLE, _REJECTED_BYTES)
+    text = chars[:needed].decode("ascii")
+    return [text[i:i + 6] for i in range(0, needed, 6)]
+
+def generate_short_id() -> str:
     """Generate a short, unique ID for tasks."""
-    # Use base62 characters (0-9, a-z, A-Z) for 6-character IDs
-    chars = string.ascii_letters + string.digits
-    return ''.join(random.choice(chars) for _ in range(6))
+    return _generate_short_ids(1)[0]
 
-def add_task_ids_to_lines(lines):
-    """Add IDs to task lines that don't already have them."""
-    updated_lines = []
-    
-    for line in lines:
-        # Only process open task lines
-        if line.startswith("- [ ]"):
-            # Check if task already has an ID
-            if "🆔 " in line:
-                # Task already has an ID, leave unchanged
-                updated_lines.append(line)
-            else:
-                # Task needs an ID
-                # Find where to insert the ID (before any metadata)
-                metadata_pattern = r'(\s*[➕📅⏭️⛔🆔]\s+\S+)'
-                match = re.search(metadata_pattern, line)
-                
-                if match:
-                    # Insert ID before the first metadata
-                    insert_pos = match.start()
-                    id_part = f" 🆔 {generate_short_id()}"
-                    updated_line = line[:insert_pos] + id_part + line[insert_pos:]
-                else:
-                    # No metadata, append ID at the end
-                    updated_line = line.rstrip() + f" 🆔 {generate_short_id()}"
-                
-                updated_lines.append(updated_line)
-        else:
-            # Not a task line, leave unchanged
-            updated_lines.append(line)
+def add_task_ids_to_lines(lines: list[str]) -> list[str]:
+    """Add IDs to task lines that don't already have them.
+
+    Returns `lines` itself when no task needed an ID, otherwise an updated copy.
+    """
+    # Only open task lines without an ID need work; the prefix check rejects
+    # everything else at the first character, before the line is searched
+    missing = [i for i, line in enumerate(lines) if line.startswith(_OPEN_TASK) and _HAS_ID not in line]
+    if not missing:
+        return lines
+
+    updated_lines = list(lines)
+    for i, task_id in zip(missing, _generate_short_ids(len(missing))):
+        updated_lines[i] = _insert_id(lines[i], task_id)[0]
     
     return updated_lines
 
-def add_task_ids_to_vault(vault_path):
-    """Update all .md files in the vault, adding IDs to open tasks that don't have them."""
+def _insert_id(line: str, task_id: str) -> tuple[str, int]:
+    """Add task_id to one task line, returning the new line and the index of its 🆔.
+
+    The ID itself is then ``new_line[offset + 2:offset + 8]``, no re-scan needed.
+    """
+    # Find where to insert the ID (before any metadata)
+    insert_pos = _find_metadata(line)
+    
+    if insert_pos != -1:
+        # Insert ID before the first metadata
+        return f"{line[:insert_pos]} 🆔 {task_id}{line[insert_pos:]}", insert_pos + 1
+    # No metadata, append ID at the end
+    head = line.rstrip()
+    return f"{head} 🆔 {task_id}", len(head) + 1
+
+def walk_md(root: str | os.PathLike[str]) -> Iterator[os.DirEntry[str]]:
+    """Yield a DirEntry for every markdown file under root, without following symlinked folders."""
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.endswith(".md") and entry.is_file():
+                    yield entry
+
+def _missing_id_spans(raw: bytes | mmap.mmap) -> list[tuple[int, int]]:
+    """Return the (start, end) of every open task line without an ID."""
+    # Only "\n" ends a line, so other line-break characters stay inside one
+    spans = [m.span() for m in _OPEN_TASK_LINE_RE.finditer(raw)]
+    if raw.find(_ID_BYTES) != -1:
+        spans = [(start, end) for start, end in spans if _HAS_ID_BYTES not in raw[start:end]]
+    return spans
+
+def _tag_buffer(raw: bytes) -> bytes | None:
+    """Return the note's contents with IDs added to its open tasks, or None if none need one."""
+    # Notes without open tasks need no decoding at all
+    if _OPEN_TASK_BYTES not in raw:
+        return None
+
+    if b"\r" in raw:
+        # Same newline translation as reading in text mode
+        raw = raw.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+    spans = _missing_id_spans(raw)
+    if not spans:
+        return None
+
+    # Decode just the task lines and splice them between the untouched bytes
+    parts = []
+    pos = 0
+    for (start, end), task_id in zip(spans, _generate_short_ids(len(spans))):
+        parts.append(raw[pos:start])
+        parts.append(_insert_id(raw[start:end].decode("utf-8"), task_id)[0].encode("utf-8"))
+        pos = end
+    parts.append(raw[pos:])
+    if raw[-1:] != b"\n":
+        parts.append(b"\n")
+    return b"".join(parts)
+
+def _tag_file(md_file: str) -> list[int] | None:
+    """Add IDs to the open tasks in one note.
+
+    Returns [mtime_ns, size] of the rewritten note, or None if it was left alone.
+    """
+    with open(md_file, "rb") as f:
+        if os.fstat(f.fileno()).st_size >= _MMAP_MIN_SIZE:
+            # Scan large notes from the page cache without a full copy; most
+            # need no change. Notes with "\r" are left to the read() path,
+            # which normalises newlines before finding the task lines.
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                needs_ids = mm.find(_OPEN_TASK_BYTES) != -1 and (
+                    mm.find(b"\r") != -1 or bool(_missing_id_spans(mm)))
+            if not needs_ids:
+                return None
+        # A note that will be rewritten is read whole, so a concurrent
+        # truncation can't fault in the middle of building the new contents
+        updated = _tag_buffer(f.read())
+    # Only write if changes were made
+    if updated is None:
+        return None
+    with open(md_file, "wb") as f:
+        f.write(updated)
+        f.flush()
+        # Stat what was just written, not whatever the path holds later
+        st = os.fstat(f.fileno())
+    return [st.st_mtime_ns, st.st_size]
+
+def _load_manifest(vault_path: Path) -> dict[str, list[int]]:
+    """Load {path: [mtime_ns, size]} for the notes seen on the last run."""
+    try:
+        with open(vault_path / ID_MANIFEST_FILE, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return manifest if isinstance(manifest, dict) else {}
+
+def _save_manifest(vault_path: Path, manifest: dict[str, list[int]]) -> None:
+    try:
+        with open(vault_path / ID_MANIFEST_FILE, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+    except OSError:
+        pass  # Only a cache; the next run re-reads every note
+
+def add_task_ids_to_vault(vault_path: str | os.PathLike[str]) -> None:
+    """Update all .md files in the vault, adding IDs to open tasks that don't have them.
+
+    Notes whose mtime and size match the last run are skipped without being read.
+    """
     vault_path = Path(vault_path)
-    for md_file in vault_path.rglob("*.md"):
-        with open(md_file, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-        updated_lines = add_task_ids_to_lines([line.rstrip("\n") for line in lines])
-        # Only write if changes were made
-        if updated_lines != [line.rstrip("\n") for line in lines]:
-            with open(md_file, "w", encoding="utf-8") as f:
-                f.write("\n".join(updated_lines) + "\n")
-            print(f"Updated: {md_file}") 
\ No newline at end of file
+    manifest = _load_manifest(vault_path)
+    seen = {}
+    md_files = []
+    walk_keys = []
+    for entry in walk_md(vault_path):
+        st = entry.stat()
+        key = [st.st_mtime_ns, st.st_size]
+        if manifest.get(entry.path) == key:
+            seen[entry.path] = key
+        else:
+            md_files.append(entry.path)
+            walk_keys.append(key)
+
+    if len(md_files) >= _PROCESS_POOL_MIN_FILES:
+        # Spread the regex work over all cores; small vaults aren't worth the worker startup
+        with ProcessPoolExecutor() as executor:
+            results = list(executor.map(_tag_file, md_files, chunksize=32))
+    else:
+        results = [_tag_file(md_file) for md_file in md_files]
+    for md_file, walk_key, written_key in zip(md_files, walk_keys, results):
+        if written_key is not None:
+            print(f"Updated: {md_file}")
+            seen[md_file] = written_key
+        else:
+            # The stat from before the read, so an edit made since then is
+            # picked up on the next run
+            seen[md_file] = walk_key
+
+    if seen != manifest:
+        _save_manifest(vault_path, seen)
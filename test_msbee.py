@@ -4,30 +4,51 @@ from pathlib import Path
 import tempfile
 import os
 import shutil
-from msbee import MsBee
+from msbee import MsBee, TASK_INDEX_FILE
 from unittest.mock import patch
 
 class TestMsBee(unittest.TestCase):
-    def setUp(self):
-        # Create a temporary directory for our test vault
-        self.test_dir = tempfile.TemporaryDirectory()
-        self.vault_path = Path(self.test_dir.name)
+    @classmethod
+    def setUpClass(cls):
+        # Create one temporary test vault for the whole class
+        cls.test_dir = tempfile.TemporaryDirectory()
+        cls.vault_path = Path(cls.test_dir.name)
         
         # Create a test vault structure
-        self.daily_path = self.vault_path / "daily"
-        self.daily_path.mkdir()
+        cls.daily_path = cls.vault_path / "daily"
+        cls.daily_path.mkdir()
         
         # Set environment variables for the test vault
-        self.old_vault_path = os.environ.get("MSBEE_VAULT_PATH")
-        self.old_daily_path = os.environ.get("MSBEE_DAILY_PATH")
-        os.environ["MSBEE_VAULT_PATH"] = str(self.vault_path)
+        cls.old_vault_path = os.environ.get("MSBEE_VAULT_PATH")
+        cls.old_daily_path = os.environ.get("MSBEE_DAILY_PATH")
+        os.environ["MSBEE_VAULT_PATH"] = str(cls.vault_path)
         os.environ["MSBEE_DAILY_PATH"] = "daily"
         
         # Create a MsBee instance for testing
-        self.msbee = MsBee(vault_path=self.vault_path, daily_notes_path=self.daily_path)
-        
+        cls.msbee = MsBee(vault_path=cls.vault_path, daily_notes_path=cls.daily_path)
+        cls.test_file = cls.vault_path / "test_tasks.md"
+
+    @classmethod
+    def tearDownClass(cls):
+        # Restore environment variables
+        if cls.old_vault_path:
+            os.environ["MSBEE_VAULT_PATH"] = cls.old_vault_path
+        else:
+            del os.environ["MSBEE_VAULT_PATH"]
+            
+        if cls.old_daily_path:
+            os.environ["MSBEE_DAILY_PATH"] = cls.old_daily_path
+        else:
+            del os.environ["MSBEE_DAILY_PATH"]
+            
+        # Clean up the temporary directory
+        cls.test_dir.cleanup()
+
+    def setUp(self):
+        # Start each test from a fresh task index so no parsed rows leak between tests
+        (self.vault_path / TASK_INDEX_FILE).unlink(missing_ok=True)
+
         # Create a test file with some tasks
-        self.test_file = self.vault_path / "test_tasks.md"
         with open(self.test_file, "w") as f:
             f.write("""# Test Tasks
 
@@ -42,21 +63,6 @@ class TestMsBee(unittest.TestCase):
 - [ ] Task with multiple metadata ➕ 2024-01-01 📅 2024-12-31 ⏭️ Uncompleted dependency
 """)
 
-    def tearDown(self):
-        # Restore environment variables
-        if self.old_vault_path:
-            os.environ["MSBEE_VAULT_PATH"] = self.old_vault_path
-        else:
-            del os.environ["MSBEE_VAULT_PATH"]
-            
-        if self.old_daily_path:
-            os.environ["MSBEE_DAILY_PATH"] = self.old_daily_path
-        else:
-            del os.environ["MSBEE_DAILY_PATH"]
-            
-        # Clean up the temporary directory
-        self.test_dir.cleanup()
-
     def test_clean_task_text(self):
         """Test the task text cleaning function."""
         test_cases = [
@@ -65,12 +71,28 @@ class TestMsBee(unittest.TestCase):
             ("Task with dependency ⏭️ Wait for dependency", "Task with dependency"),
             ("Task with multiple ➕ 2024-01-01 📅 2024-12-31 ⏭️ Wait", "Task with multiple"),
             ("Task with all metadata ➕ 2024-01-01 📅 2024-12-31 ⏭️ Wait ⛔ abc123 🆔 xyz789", "Task with all metadata"),
+            ("Task with done date ✅ 2024-01-02", "Task with done date"),
         ]
         
         for input_text, expected in test_cases:
             with self.subTest(input_text=input_text):
                 self.assertEqual(self.msbee.clean_task_text(input_text), expected)
 
+    def test_client_is_shared(self):
+        """Test that MsBee instances with the same API key share one OpenAI client."""
+        other = MsBee(vault_path=self.vault_path)
+        self.assertIs(other.client, self.msbee.client)
+        self.assertIsNot(MsBee(vault_path=self.vault_path, openai_api_key="other-key").client, self.msbee.client)
+
+    def test_model_selection(self):
+        """Test that the model defaults to a mini tier and can be overridden."""
+        with patch.dict(os.environ):
+            os.environ.pop("MSBEE_MODEL", None)
+            self.assertEqual(MsBee(vault_path=self.vault_path).model, "gpt-4o-mini")
+        with patch.dict(os.environ, {"MSBEE_MODEL": "gpt-4"}):
+            self.assertEqual(MsBee(vault_path=self.vault_path).model, "gpt-4")
+        self.assertEqual(MsBee(vault_path=self.vault_path, model="gpt-4.1-mini").model, "gpt-4.1-mini")
+
     def test_extract_tasks_basic(self):
         """Test basic task extraction without dependencies."""
         tasks = self.msbee.extract_tasks(today=date(2024, 1, 1))
@@ -91,6 +113,23 @@ class TestMsBee(unittest.TestCase):
         task_texts = [task[0] for task in tasks]
         self.assertNotIn("Task with future start date 🛫 2025-01-01", task_texts)
 
+    def test_extract_tasks_ids_and_start_dates(self):
+        """Test that IDs and start dates are both read from the task metadata."""
+        with open(self.test_file, "w") as f:
+            f.write("""# Test Tasks
+
+- [ ] Started task 🆔 abc123 🛫 2023-12-01
+- [ ] Later task 🛫 2024-02-01 🆔 def456
+- [ ] Task without ID
+""")
+
+        tasks = self.msbee.extract_tasks(today=date(2024, 1, 1))
+
+        self.assertEqual({task[0]: task[2] for task in tasks}, {
+            "Started task 🆔 abc123 🛫 2023-12-01": "abc123",
+            "Task without ID": None,
+        })
+
     def test_extract_tasks_dependencies(self):
         """Test task extraction with dependencies."""
         # Create a file with a dependency chain
@@ -107,6 +146,7 @@ class TestMsBee(unittest.TestCase):
         # Only Task C should be included since it has no dependencies
         self.assertEqual(len(tasks), 1)
         self.assertEqual(tasks[0][0], "Task C")
+        self.assertEqual(tasks[0][3], "test_tasks.md")
 
     def test_extract_tasks_completed_dependency(self):
         """Test that a task with a completed dependency is extracted."""
@@ -124,6 +164,20 @@ class TestMsBee(unittest.TestCase):
         self.assertEqual(len(tasks), 1)
         self.assertEqual(tasks[0][0], "Task with completed dependency ⏭️ Completed dependency task")
 
+    def test_extract_tasks_completed_with_done_date(self):
+        """Test that a completed copy with a done date marks the open task completed."""
+        with open(self.test_file, "w") as f:
+            f.write("""# Test Tasks
+
+- [x] Water the plants ✅ 2024-01-01
+- [ ] Water the plants
+""")
+
+        tasks = self.msbee.extract_tasks(today=date(2024, 1, 1))
+
+        # The open copy should be recognised as done
+        self.assertEqual(tasks, [])
+
     def test_extract_tasks_uncompleted_dependency(self):
         """Test that a task with an uncompleted dependency is not extracted."""
         # Create a file with a task that depends on an uncompleted task
@@ -140,6 +194,34 @@ class TestMsBee(unittest.TestCase):
         self.assertEqual(len(tasks), 1)
         self.assertEqual(tasks[0][0], "Uncompleted dependency task")
 
+    def test_extract_tasks_reuses_index(self):
+        """Test that only files changed since the last run are parsed again."""
+        first = self.msbee.extract_tasks(today=date(2024, 1, 1))
+        self.assertTrue((self.vault_path / TASK_INDEX_FILE).exists())
+
+        with patch.object(MsBee, "_parse_md", side_effect=AssertionError("unchanged file was parsed")):
+            self.assertEqual(self.msbee.extract_tasks(today=date(2024, 1, 1)), first)
+
+        with open(self.test_file, "a") as f:
+            f.write("- [ ] Newly added task\n")
+        task_texts = [task[0] for task in self.msbee.extract_tasks(today=date(2024, 1, 1))]
+        self.assertIn("Newly added task", task_texts)
+
+    def test_extract_roadmap(self):
+        """Test that the roadmap is re-read only when the file changes."""
+        roadmap_path = self.vault_path / "roadmap.md"
+        msbee = MsBee(vault_path=self.vault_path, roadmap_path=roadmap_path)
+        self.assertEqual(msbee.extract_roadmap(), "No roadmap found.")
+
+        roadmap_path.write_text("- Ship it", encoding="utf-8")
+        self.assertEqual(msbee.extract_roadmap(), "- Ship it")
+        with patch("builtins.open") as mock_open:
+            self.assertEqual(msbee.extract_roadmap(), "- Ship it")
+            mock_open.assert_not_called()
+
+        roadmap_path.write_text("- Ship it\n- Celebrate", encoding="utf-8")
+        self.assertEqual(msbee.extract_roadmap(), "- Ship it\n- Celebrate")
+
     def test_update_daily_note_replaces_section(self):
         """Test that update_daily_note replaces an existing MsBee section (marker-based)."""
         today = date(2024, 1, 1)
@@ -166,6 +248,19 @@ More content.
         self.assertIn(new_content, updated)
         # The old MsBee section may still exist, but the marker section should be updated
 
+    def test_update_daily_note_keeps_backslashes(self):
+        """Test that backslashes in the new content are written literally."""
+        today = date(2024, 1, 1)
+        daily_note = self.daily_path / f"{today.isoformat()}.md"
+        with open(daily_note, "w") as f:
+            f.write("# Daily Note\n\n<!-- START tasks -->\nOld\n<!-- END tasks -->\n")
+        new_content = "## 🌟 Focus Tasks\nOpen C:\\notes\\1 first"
+        self.msbee.update_daily_note(new_content, note_date=today)
+        with open(daily_note, "r") as f:
+            updated = f.read()
+        self.assertIn(new_content, updated)
+        self.assertNotIn("Old", updated)
+
     def test_update_daily_note_inserts_section(self):
         """Test that update_daily_note inserts a MsBee section with markers if not present."""
         today = date(2024, 1, 1)
@@ -1,13 +1,15 @@
+import json
 import re
 from pathlib import Path
+import pytest
 from msbee import MsBee
 
 def fake_tasks():
-    # Returns a list of (task_text, location, task_id)
+    # Returns a list of (task_text, location, task_id, relative_path)
     return [
-        ("Do the thing 🆔 abc123", Path("folder1/file1.md"), "abc123"),
-        ("Write report 🆔 def456", Path("folder2/file2.md"), "def456"),
-        ("Plan project 🆔 ghi789", Path("folder3/file3.md"), "ghi789"),
+        ("Do the thing 🆔 abc123", Path("folder1/file1.md"), "abc123", "folder1/file1.md"),
+        ("Write report 🆔 def456", Path("folder2/file2.md"), "def456", "folder2/file2.md"),
+        ("Plan project 🆔 ghi789", Path("folder3/file3.md"), "ghi789", "folder3/file3.md"),
     ]
 
 def test_query_generation_basic(monkeypatch):
@@ -16,28 +18,27 @@ def test_query_generation_basic(monkeypatch):
     roadmap = "- Do the thing\n- Write report\n- Plan project"
 
     # Simulate LLM response
-    llm_response = '''
-## 🌟 Focus Tasks
-1. "Do the thing 🆔 abc123" in folder1/file1.md (ID: abc123) — Most urgent
-2. "Write report 🆔 def456" in folder2/file2.md (ID: def456) — Due soon
-3. "Plan project 🆔 ghi789" in folder3/file3.md (ID: ghi789) — Important for roadmap
+    llm_response = json.dumps({
+        "focus": [
+            {"id": "abc123", "reason": "Most urgent"},
+            {"id": "def456", "reason": "Due soon"},
+            {"id": "ghi789", "reason": "Important for roadmap"},
+        ],
+        "nudge": "Keep going!",
+        "quote": "You got this!",
+    })
 
-## 🐝 Nudge
-Keep going!
-
-## 🔒 Lock Screen Quote
-"You got this!"
-'''
-
-    # Patch the OpenAI client to return our fake response
+    # Patch the OpenAI client to stream our fake response
     class FakeChoice:
         def __init__(self, content):
-            self.message = type('msg', (), {'content': content})
-    class FakeResponse:
+            self.delta = type('delta', (), {'content': content})
+    class FakeChunk:
         def __init__(self, content):
             self.choices = [FakeChoice(content)]
     def fake_create(*args, **kwargs):
-        return FakeResponse(llm_response)
+        # Stream the response in two chunks
+        half = len(llm_response) // 2
+        return iter([FakeChunk(llm_response[:half]), FakeChunk(llm_response[half:])])
     monkeypatch.setattr(msbee.client.chat.completions, "create", fake_create)
 
     result = msbee.ask_msbee(tasks, roadmap)
@@ -51,6 +52,9 @@ Keep going!
     assert result.count('```tasks') == 1
     # Should have all three tasks listed
     assert result.count('(ID: ') == 3
+    # Nudge and quote are formatted from the JSON fields
+    assert '## 🐝 Nudge\nKeep going!' in result
+    assert result.endswith('## 🔒 Lock Screen Quote\n"You got this!"')
 
 
 def test_query_generation_partial(monkeypatch):
@@ -58,26 +62,26 @@ def test_query_generation_partial(monkeypatch):
     tasks = fake_tasks()
     roadmap = "- Do the thing\n- Write report\n- Plan project"
 
-    # Simulate LLM response with only two tasks
-    llm_response = '''
-## 🌟 Focus Tasks
-1. "Do the thing 🆔 abc123" in folder1/file1.md (ID: abc123) — Most urgent
-2. "Plan project 🆔 ghi789" in folder3/file3.md (ID: ghi789) — Important for roadmap
-
-## 🐝 Nudge
-Keep going!
-
-## 🔒 Lock Screen Quote
-"You got this!"
-'''
+    # Simulate LLM response with only two real tasks
+    llm_response = json.dumps({
+        "focus": [
+            {"id": "abc123", "reason": "Most urgent"},
+            {"id": "ghi789", "reason": "Important for roadmap"},
+            {"id": "zzz999", "reason": "Not one of the open tasks"},
+        ],
+        "nudge": "Keep going!",
+        "quote": "You got this!",
+    })
     class FakeChoice:
         def __init__(self, content):
-            self.message = type('msg', (), {'content': content})
-    class FakeResponse:
+            self.delta = type('delta', (), {'content': content})
+    class FakeChunk:
         def __init__(self, content):
             self.choices = [FakeChoice(content)]
     def fake_create(*args, **kwargs):
-        return FakeResponse(llm_response)
+        # Stream the response in two chunks
+        half = len(llm_response) // 2
+        return iter([FakeChunk(llm_response[:half]), FakeChunk(llm_response[half:])])
     monkeypatch.setattr(msbee.client.chat.completions, "create", fake_create)
 
     result = msbee.ask_msbee(tasks, roadmap)
@@ -86,4 +90,162 @@ Keep going!
     assert 'id includes def456' not in result
     assert result.count('```tasks') == 1
     assert result.count('(ID: ') == 2
-    assert result.count('in folder') == 2 
\ No newline at end of file
+    assert result.count('in folder') == 2 
+
+@pytest.mark.parametrize("gpt_content, expected_ids", [
+    (json.dumps({"focus": ["abc123", "def456"]}), ["abc123", "def456"]),
+    (json.dumps({"focus": None, "nudge": None, "quote": 5}), []),
+    (json.dumps({"focus": [{"id": ["abc123"]}, {"id": "ghi789", "reason": ["Roadmap"]}, 7]}), ["ghi789"]),
+    (json.dumps(["abc123"]), []),
+    ('{"focus": [{"id": "abc123", "reas', []),
+])
+def test_query_generation_malformed_reply(gpt_content, expected_ids):
+    msbee = MsBee(vault_path='.')
+
+    # Off-shape or truncated replies should drop the bad picks, not crash
+    result = msbee._parse_reply(gpt_content, fake_tasks())
+    assert re.findall(r'\(ID: (\w+)\)', result) == expected_ids
+    assert result.count('```tasks') == (1 if expected_ids else 0)
+    assert '## 🐝 Nudge' in result
+    assert result.endswith('## 🔒 Lock Screen Quote\n""')
+
+def test_query_generation_many(monkeypatch):
+    msbee = MsBee(vault_path='.')
+    tasks = fake_tasks()
+    roadmap = "- Do the thing\n- Write report\n- Plan project"
+
+    # Simulate one LLM response covering two days
+    llm_response = json.dumps({"days": [
+        {"focus": [{"id": "abc123", "reason": "Most urgent"}],
+         "nudge": "Keep going!", "quote": "You got this!"},
+        {"focus": [{"id": "def456", "reason": "Due soon"}, {"id": "ghi789", "reason": "Roadmap"}],
+         "nudge": "Nearly there!", "quote": "One step at a time."},
+    ]})
+    class FakeChoice:
+        def __init__(self, content):
+            self.delta = type('delta', (), {'content': content})
+    class FakeChunk:
+        def __init__(self, content):
+            self.choices = [FakeChoice(content)]
+    calls = []
+    def fake_create(*args, **kwargs):
+        calls.append(kwargs)
+        return iter([FakeChunk(llm_response)])
+    monkeypatch.setattr(msbee.client.chat.completions, "create", fake_create)
+
+    first, second = msbee.ask_msbee_many([(tasks, roadmap), (tasks[1:], roadmap)])
+    # Both days should come from a single request
+    assert len(calls) == 1
+    assert calls[0]["stream"] is True
+    assert calls[0]["model"] == msbee.model
+    assert calls[0]["response_format"] == {"type": "json_object"}
+    assert 'id includes abc123' in first
+    assert 'id includes def456' not in first
+    assert 'Keep going!' in first
+    assert '(id includes def456) OR (id includes ghi789)' in second
+    assert '"One step at a time."' in second
+    assert second.count('(ID: ') == 2
+
+
+def test_query_generation_many_malformed(monkeypatch):
+    msbee = MsBee(vault_path='.')
+    tasks = fake_tasks()
+    roadmap = "- Do the thing"
+
+    class FakeChoice:
+        def __init__(self, content):
+            self.delta = type('delta', (), {'content': content})
+    class FakeChunk:
+        def __init__(self, content):
+            self.choices = [FakeChoice(content)]
+    replies = []
+    monkeypatch.setattr(msbee.client.chat.completions, "create", lambda **kwargs: iter([FakeChunk(replies[-1])]))
+
+    # An off-shape day plan becomes an empty section for that day only
+    replies.append(json.dumps({"days": ["oops", {"focus": ["def456"]}]}))
+    first, second = msbee.ask_msbee_many([(tasks, roadmap), (tasks, roadmap)])
+    assert '(ID: ' not in first
+    assert 'id includes def456' in second
+
+    # A truncated or off-shape reply reports the missing days
+    for reply in ('{"days": [{"focus": [', json.dumps({"days": None})):
+        replies.append(reply)
+        with pytest.raises(ValueError, match="Expected 2 days"):
+            msbee.ask_msbee_many([(tasks, roadmap), (tasks, roadmap)])
+
+
+def test_query_generation_batch(monkeypatch):
+    msbee = MsBee(vault_path='.')
+    tasks = fake_tasks()
+    roadmap = "- Do the thing\n- Write report\n- Plan project"
+
+    replies = {
+        "0": json.dumps({"focus": [{"id": "abc123", "reason": "Most urgent"}], "nudge": "Go!", "quote": "Now."}),
+        "1": json.dumps({"focus": [{"id": "ghi789", "reason": "Important"}], "nudge": "Go!", "quote": "Now."}),
+    }
+
+    # Fake the files and batches endpoints; the batch completes on the first poll
+    class FakeBatch:
+        def __init__(self, status):
+            self.id = "batch_1"
+            self.status = status
+            self.output_file_id = "file_out"
+    class FakeFiles:
+        def __init__(self):
+            self.uploaded = None
+        def create(self, file, purpose):
+            self.uploaded = file[1].decode("utf-8")
+            return type('file', (), {'id': 'file_in'})
+        def content(self, file_id):
+            # Return results out of order, as the Batch API may
+            lines = [
+                json.dumps({"custom_id": custom_id, "response": {"status_code": 200, "body": {"choices": [{"message": {"content": content}}]}}})
+                for custom_id, content in reversed(replies.items())
+            ]
+            return type('content', (), {'text': "\n".join(lines)})
+    class FakeBatches:
+        def create(self, **kwargs):
+            return FakeBatch("validating")
+        def retrieve(self, batch_id):
+            return FakeBatch("completed")
+    files = FakeFiles()
+    fake_client = type('client', (), {'files': files, 'batches': FakeBatches()})
+    monkeypatch.setattr(msbee, "client", fake_client)
+
+    first, second = msbee.ask_msbee_batch([(tasks, roadmap), (tasks, roadmap)], poll_interval=0)
+    # One JSONL request line per input
+    assert [json.loads(line)["custom_id"] for line in files.uploaded.splitlines()] == ["0", "1"]
+    assert 'id includes abc123' in first
+    assert 'id includes ghi789' in second
+    assert 'id includes ghi789' not in first
+
+
+def test_query_generation_batch_failures(monkeypatch):
+    msbee = MsBee(vault_path='.')
+    tasks = fake_tasks()
+    inputs = [(tasks, "- Do the thing"), (tasks, "- Do the thing")]
+
+    # Input 0 succeeded and input 1 failed with a server error
+    output = "\n".join([
+        json.dumps({"custom_id": "0", "response": {"status_code": 200, "body": {"choices": [{"message": {"content": "{}"}}]}}}),
+        json.dumps({"custom_id": "1", "response": {"status_code": 500, "body": {"error": {"message": "Server error"}}}}),
+    ])
+    class FakeFiles:
+        def create(self, file, purpose):
+            return type('file', (), {'id': 'file_in'})
+        def content(self, file_id):
+            assert file_id is not None
+            return type('content', (), {'text': output})
+    batch = type('batch', (), {'id': 'batch_1', 'status': 'completed', 'output_file_id': 'file_out', 'error_file_id': 'file_err'})
+    class FakeBatches:
+        def create(self, **kwargs):
+            return batch
+    monkeypatch.setattr(msbee, "client", type('client', (), {'files': FakeFiles(), 'batches': FakeBatches()}))
+
+    with pytest.raises(RuntimeError, match="no reply for input 1"):
+        msbee.ask_msbee_batch(inputs, poll_interval=0)
+
+    # When every request fails the batch completes with only an error file
+    batch.output_file_id = None
+    with pytest.raises(RuntimeError, match="see error file file_err"):
+        msbee.ask_msbee_batch(inputs, poll_interval=0)
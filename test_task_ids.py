@@ -1,9 +1,11 @@
 import unittest
 import re
+import task_ids
 import tempfile
 import os
 from pathlib import Path
-from task_ids import add_task_ids_to_lines, generate_short_id, add_task_ids_to_vault
+from unittest.mock import patch
+from task_ids import add_task_ids_to_lines, generate_short_id, add_task_ids_to_vault, walk_md, ID_MANIFEST_FILE, _insert_id
 
 class TestTaskIds(unittest.TestCase):
     def test_generate_short_id(self):
@@ -22,6 +24,12 @@ class TestTaskIds(unittest.TestCase):
         self.assertTrue(id1.isalnum())
         self.assertTrue(id2.isalnum())
 
+    def test_generate_short_id_rejects_biased_bytes(self):
+        """Test that random bytes outside the unbiased range are discarded."""
+        draws = iter([b"\xff" * 14, b"\xf8\x00\x3e\x7c\xba\xf7" * 3])
+        with patch("task_ids.random.randbytes", side_effect=lambda n: next(draws)):
+            self.assertEqual(generate_short_id(), "aaaa9a")
+
     def test_add_id_to_task_without_id(self):
         """Test adding ID to a task that doesn't have one."""
         lines = [
@@ -49,9 +57,10 @@ class TestTaskIds(unittest.TestCase):
         
         updated_lines = add_task_ids_to_lines(lines)
         
-        # Lines should be unchanged
+        # Lines should be unchanged, and the input list returned as-is
         self.assertEqual(updated_lines[0], lines[0])
         self.assertEqual(updated_lines[1], lines[1])
+        self.assertIs(updated_lines, lines)
 
     def test_id_placement(self):
         """Test that IDs are placed in the correct position."""
@@ -77,6 +86,20 @@ class TestTaskIds(unittest.TestCase):
         self.assertIsNotNone(plus_index)
         self.assertLess(id_index, plus_index)
 
+    def test_id_placement_before_dependency(self):
+        """Test that the ID does not split the two-code-point ⏭️ emoji."""
+        for dependency in ("⏭️", "⏭"):
+            with self.subTest(dependency=dependency):
+                updated_line = add_task_ids_to_lines([f"- [ ] Task {dependency} Other task"])[0]
+                self.assertRegex(updated_line, rf"^- \[ \] Task 🆔 [a-zA-Z0-9]{{6}} {dependency} Other task$")
+
+    def test_insert_id_offset(self):
+        """Test that the returned offset points at the inserted ID."""
+        for line in ("- [ ] Task ➕ 2025-06-30 📅 2025-07-01", "- [ ] Task   "):
+            with self.subTest(line=line):
+                updated_line, offset = _insert_id(line, "abc123")
+                self.assertEqual(updated_line[offset:offset + 8], "🆔 abc123")
+
     def test_non_task_lines_unchanged(self):
         """Test that non-task lines are not modified."""
         lines = [
@@ -98,6 +121,9 @@ class TestTaskIds(unittest.TestCase):
         self.assertIn("🆔 ", updated_lines[3])
         self.assertNotIn("🆔 ", updated_lines[2])  # Completed task
 
+        # The input list itself is left untouched
+        self.assertEqual(lines[3], "- [ ] Task that needs ID")
+
     def test_completed_tasks_unchanged(self):
         """Test that completed tasks are not modified."""
         lines = [
@@ -136,6 +162,23 @@ class TestTaskIds(unittest.TestCase):
         # Check that task with existing ID is unchanged
         self.assertEqual(updated_lines[4], lines[4])  # Third task unchanged
 
+        # IDs drawn in one batch should still be distinct
+        new_ids = {re.search(r'🆔 ([a-zA-Z0-9]{6})', updated_lines[i]).group(1) for i in (2, 3, 5)}
+        self.assertEqual(len(new_ids), 3)
+
+    def test_walk_md(self):
+        """Test that the vault walk finds nested markdown files only."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            (tmpdir / "daily" / "2025").mkdir(parents=True)
+            (tmpdir / "top.md").write_text("# Top", encoding="utf-8")
+            (tmpdir / "daily" / "2025" / "note.md").write_text("# Note", encoding="utf-8")
+            (tmpdir / "daily" / "image.png").write_bytes(b"")
+            (tmpdir / "folder.md").mkdir()
+
+            found = sorted(Path(entry.path).relative_to(tmpdir).as_posix() for entry in walk_md(tmpdir))
+            self.assertEqual(found, ["daily/2025/note.md", "top.md"])
+
     def test_file_only_updated_if_changed(self):
         """Test that files are only updated if something changed."""
         with tempfile.TemporaryDirectory() as tmpdir:
@@ -166,5 +209,75 @@ class TestTaskIds(unittest.TestCase):
             updated_lines = test_file.read_text(encoding="utf-8").splitlines()
             self.assertIn("🆔 ", updated_lines[1])
 
+    def test_vault_updated_in_parallel(self):
+        """Test that large vaults are tagged through the process pool."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            for i in range(5):
+                (tmpdir / f"note{i}.md").write_text(f"- [ ] Task {i}\n- [ ] Tagged 🆔 abc12{i}\n", encoding="utf-8")
+
+            with patch("task_ids._PROCESS_POOL_MIN_FILES", 2):
+                add_task_ids_to_vault(tmpdir)
+
+            for i in range(5):
+                updated_lines = (tmpdir / f"note{i}.md").read_text(encoding="utf-8").splitlines()
+                self.assertRegex(updated_lines[0], rf"^- \[ \] Task {i} 🆔 [a-zA-Z0-9]{{6}}$")
+                self.assertEqual(updated_lines[1], f"- [ ] Tagged 🆔 abc12{i}")
+
+    def test_large_note_mapped(self):
+        """Test that notes read through mmap are tagged the same way, and empty ones are left alone."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            test_file = tmpdir / "test.md"
+            test_file.write_bytes("# Note\r\n- [ ] Task one ➕ 2025-06-30\r\n- [ ] Task two 🆔 abc123".encode("utf-8"))
+            (tmpdir / "empty.md").write_bytes(b"")
+
+            with patch("task_ids._MMAP_MIN_SIZE", 1):
+                add_task_ids_to_vault(tmpdir)
+
+            updated_lines = test_file.read_bytes().decode("utf-8").split("\n")
+            self.assertRegex(updated_lines[1], r"^- \[ \] Task one 🆔 [a-zA-Z0-9]{6} ➕ 2025-06-30$")
+            self.assertEqual(updated_lines[2:], ["- [ ] Task two 🆔 abc123", ""])
+            self.assertEqual((tmpdir / "empty.md").read_bytes(), b"")
+
+    def test_unchanged_files_skipped(self):
+        """Test that notes unchanged since the last run are not read again."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            test_file = tmpdir / "test.md"
+            test_file.write_text("- [ ] Task one\n", encoding="utf-8")
+            add_task_ids_to_vault(tmpdir)
+            self.assertTrue((tmpdir / ID_MANIFEST_FILE).exists())
+
+            with patch("task_ids._tag_file", side_effect=AssertionError("unchanged note was read")):
+                add_task_ids_to_vault(tmpdir)
+
+            test_file.write_text(test_file.read_text(encoding="utf-8") + "- [ ] Task two\n", encoding="utf-8")
+            add_task_ids_to_vault(tmpdir)
+            self.assertIn("🆔 ", test_file.read_text(encoding="utf-8").splitlines()[1])
+
+    def test_note_edited_during_run_retagged(self):
+        """Test that a note edited after it was read is tagged again on the next run."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            test_file = tmpdir / "test.md"
+            test_file.write_text("- [ ] Task one 🆔 abc123\n", encoding="utf-8")
+
+            tag_file = task_ids._tag_file
+
+            def tag_then_edit(md_file):
+                result = tag_file(md_file)
+                # The user saves a new task right after the note was read
+                with open(md_file, "a", encoding="utf-8") as f:
+                    f.write("- [ ] Task two\n")
+                return result
+
+            with patch("task_ids._tag_file", side_effect=tag_then_edit):
+                add_task_ids_to_vault(tmpdir)
+            self.assertNotIn("🆔 ", test_file.read_text(encoding="utf-8").splitlines()[1])
+
+            add_task_ids_to_vault(tmpdir)
+            self.assertRegex(test_file.read_text(encoding="utf-8").splitlines()[1], r"^- \[ \] Task two 🆔 [a-zA-Z0-9]{6}$")
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file